@@ -1,29 +1,79 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Blueprint, current_app, request, jsonify, g
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity, verify_jwt_in_request
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.middleware.proxy_fix import ProxyFix
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine
 from functools import wraps
+from collections import Counter, OrderedDict
 from datetime import datetime, timedelta
+import logging
+import math
 import os
+import sqlite3
+import threading
+import time
+import click
 from dotenv import load_dotenv
 
+try:
+    import redis
+except ImportError:  # Redis is optional; rate limits fall back to per-process memory
+    redis = None
+
 # Load environment variables
 load_dotenv()
 
-# Initialize Flask app
-app = Flask(__name__)
-
-# Configuration
-app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///wish_wall.db')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'your-secret-key-change-in-production')
-app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(days=30)
+# Extensions are created unbound and attached to each app in create_app
+db = SQLAlchemy()
+jwt = JWTManager()
+cors = CORS()
+
+# Routes, request hooks and CLI commands, registered on every app by create_app
+api = Blueprint('api', __name__, cli_group=None)
+
+
+def load_config():
+    """Read configuration from the environment at app creation time"""
+    return {
+        'LOG_LEVEL': os.getenv('LOG_LEVEL', 'INFO'),
+        'SQLALCHEMY_DATABASE_URI': os.getenv('DATABASE_URL', 'sqlite:///wish_wall.db'),
+        'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'JWT_SECRET_KEY': os.getenv('JWT_SECRET_KEY', 'your-secret-key-change-in-production'),
+        'JWT_ACCESS_TOKEN_EXPIRES': timedelta(days=30),
+        'USER_PURGE_BATCH_SIZE': int(os.getenv('USER_PURGE_BATCH_SIZE', 500)),
+        'REDIS_URL': os.getenv('REDIS_URL'),
+        # Number of reverse proxies in front of the app whose X-Forwarded-* headers are trusted
+        'TRUSTED_PROXIES': int(os.getenv('TRUSTED_PROXIES', 0)),
+        'RATE_LIMIT_ENABLED': os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true',
+        # Per-endpoint limits as "endpoint=count/period", e.g. "login=10/minute,search=30/minute"
+        'RATE_LIMITS': os.getenv('RATE_LIMITS', 'login=10/minute,register=5/minute,search=30/minute,get_wish_facets=30/minute'),
+        'RATE_LIMIT_MAX_BUCKETS': int(os.getenv('RATE_LIMIT_MAX_BUCKETS', 10000)),
+        'RATE_LIMIT_REDIS_RETRY': int(os.getenv('RATE_LIMIT_REDIS_RETRY', 30)),
+        'MAX_CONCURRENT_REQUESTS': int(os.getenv('MAX_CONCURRENT_REQUESTS', 32)),
+        'REQUEST_QUEUE_TIMEOUT': float(os.getenv('REQUEST_QUEUE_TIMEOUT', 0.5)),
+        'OVERLOAD_RETRY_AFTER': int(os.getenv('OVERLOAD_RETRY_AFTER', 1)),
+        'JOB_MAX_ATTEMPTS': int(os.getenv('JOB_MAX_ATTEMPTS', 5)),
+        'JOB_RETRY_BASE_DELAY': int(os.getenv('JOB_RETRY_BASE_DELAY', 10)),
+        'JOB_LOCK_TIMEOUT': int(os.getenv('JOB_LOCK_TIMEOUT', 600)),
+        'JOB_CLEANUP_INTERVAL': int(os.getenv('JOB_CLEANUP_INTERVAL', 3600)),
+        'JOB_RETENTION_DAYS': int(os.getenv('JOB_RETENTION_DAYS', 7)),
+        'WORKER_POLL_INTERVAL': float(os.getenv('WORKER_POLL_INTERVAL', 1.0)),
+        'FACET_REBUILD_INTERVAL': int(os.getenv('FACET_REBUILD_INTERVAL', 3600))
+    }
+
+
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    """SQLite ignores ON DELETE CASCADE unless foreign keys are switched on per connection"""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
 
-# Initialize extensions
-db = SQLAlchemy(app)
-jwt = JWTManager(app)
-CORS(app)
 
 # ==================== Database Models ====================
 
@@ -41,10 +91,11 @@ class User(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    # Relationships
-    wishes = db.relationship('Wish', backref='author', lazy=True, cascade='all, delete-orphan')
-    comments = db.relationship('Comment', backref='author', lazy=True, cascade='all, delete-orphan')
-    likes = db.relationship('Like', backref='user', lazy=True, cascade='all, delete-orphan')
+    # Relationships (child rows are removed by ON DELETE CASCADE in the database,
+    # so passive_deletes keeps the ORM from loading them just to delete them)
+    wishes = db.relationship('Wish', backref='author', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+    comments = db.relationship('Comment', backref='author', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+    likes = db.relationship('Like', backref='user', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
     
     def set_password(self, password):
         """Hash and set password"""
@@ -75,7 +126,7 @@ class Wish(db.Model):
     __tablename__ = 'wishes'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
     title = db.Column(db.String(255), nullable=False)
     content = db.Column(db.Text, nullable=False)
     category = db.Column(db.String(50), default='general')
@@ -88,8 +139,8 @@ class Wish(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
-    comments = db.relationship('Comment', backref='wish', lazy=True, cascade='all, delete-orphan')
-    likes = db.relationship('Like', backref='wish', lazy=True, cascade='all, delete-orphan')
+    comments = db.relationship('Comment', backref='wish', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+    likes = db.relationship('Like', backref='wish', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
     
     def to_dict(self, include_author=True, include_comments=False):
         """Convert wish to dictionary"""
@@ -120,8 +171,8 @@ class Comment(db.Model):
     __tablename__ = 'comments'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
-    wish_id = db.Column(db.Integer, db.ForeignKey('wishes.id'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+    wish_id = db.Column(db.Integer, db.ForeignKey('wishes.id', ondelete='CASCADE'), nullable=False, index=True)
     content = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -142,8 +193,8 @@ class Like(db.Model):
     __tablename__ = 'likes'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
-    wish_id = db.Column(db.Integer, db.ForeignKey('wishes.id'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+    wish_id = db.Column(db.Integer, db.ForeignKey('wishes.id', ondelete='CASCADE'), nullable=False, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     __table_args__ = (db.UniqueConstraint('user_id', 'wish_id', name='unique_like'),)
@@ -158,9 +209,256 @@ class Like(db.Model):
         }
 
 
+class WishFacetCount(db.Model):
+    """Precomputed number of public wishes per category and status"""
+    __tablename__ = 'wish_facet_counts'
+    
+    facet = db.Column(db.String(20), primary_key=True)  # category, status
+    value = db.Column(db.String(50), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class Job(db.Model):
+    """Job model for the background task queue"""
+    __tablename__ = 'jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(80), nullable=False)
+    key = db.Column(db.String(120), index=True)  # identifies jobs that must not be queued twice
+    payload = db.Column(db.JSON, default=dict)
+    status = db.Column(db.String(20), default='queued')  # queued, running, done, failed
+    attempts = db.Column(db.Integer, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False)
+    last_error = db.Column(db.Text)
+    run_at = db.Column(db.DateTime, default=datetime.utcnow)
+    locked_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (db.Index('ix_jobs_status_run_at', 'status', 'run_at'),)
+    
+    def to_dict(self):
+        """Convert job to dictionary"""
+        return {
+            'id': self.id,
+            'name': self.name,
+            'key': self.key,
+            'payload': self.payload,
+            'status': self.status,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'last_error': self.last_error,
+            'run_at': self.run_at.isoformat(),
+            'created_at': self.created_at.isoformat(),
+        }
+
+
+# ==================== Admission Control ====================
+
+RATE_LIMIT_PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+# Token bucket refilled continuously; returns [allowed, tokens left] atomically
+REDIS_TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+
+def parse_rate_limits(spec):
+    """Parse "endpoint=count/period,..." into {endpoint: (capacity, tokens per second)}"""
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        endpoint, _, rate = item.partition('=')
+        count, _, period = rate.partition('/')
+        limits[endpoint.strip()] = (int(count), int(count) / RATE_LIMIT_PERIODS[period.strip()])
+    return limits
+
+
+class MemoryRateLimitBackend:
+    """Token buckets kept in process memory, enough for a single worker"""
+    
+    def __init__(self, max_buckets=10000):
+        # key -> (tokens, last update, time the bucket is full again), least recently used first
+        self.buckets = OrderedDict()
+        self.max_buckets = max_buckets
+        self.lock = threading.Lock()
+    
+    def consume(self, key, capacity, rate):
+        """Take one token from the bucket; return (allowed, seconds until next token)"""
+        now = time.monotonic()
+        with self.lock:
+            tokens, ts, _ = self.buckets.pop(key, (capacity, now, now))
+            tokens = min(capacity, tokens + (now - ts) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self.buckets[key] = (tokens, now, now + (capacity - tokens) / rate)
+            if len(self.buckets) > self.max_buckets:
+                self.prune(now)
+        return allowed, 0 if allowed else (1 - tokens) / rate
+    
+    def prune(self, now):
+        """Drop refilled buckets, then the least recently used ones, down to 90% of the cap"""
+        # A full bucket behaves exactly like a missing one, so dropping it is lossless
+        for key in [key for key, (_, _, full_at) in self.buckets.items() if full_at <= now]:
+            del self.buckets[key]
+        while len(self.buckets) > self.max_buckets * 9 // 10:
+            self.buckets.popitem(last=False)
+
+
+class RedisRateLimitBackend:
+    """Token buckets shared by all workers through Redis"""
+    
+    def __init__(self, url):
+        # Short timeouts so an unreachable Redis cannot stall request handling
+        self.client = redis.Redis.from_url(url, socket_timeout=0.2, socket_connect_timeout=0.2)
+        self.script = self.client.register_script(REDIS_TOKEN_BUCKET_SCRIPT)
+    
+    def consume(self, key, capacity, rate):
+        """Take one token from the bucket; return (allowed, seconds until next token)"""
+        allowed, tokens = self.script(keys=[f'ratelimit:{key}'], args=[capacity, rate, time.time()])
+        tokens = float(tokens)
+        return bool(allowed), 0 if allowed else (1 - tokens) / rate
+
+
+class AdmissionControl:
+    """Rate limit buckets and request slots belonging to one app"""
+    
+    def __init__(self, config):
+        self.rate_limits = parse_rate_limits(config['RATE_LIMITS'])
+        self.memory_backend = MemoryRateLimitBackend(config['RATE_LIMIT_MAX_BUCKETS'])
+        if config['REDIS_URL'] and redis is not None:
+            self.backend = RedisRateLimitBackend(config['REDIS_URL'])
+        else:
+            self.backend = self.memory_backend
+        # Circuit breaker: after a Redis failure, skip it until this monotonic time
+        self.redis_retry_interval = config['RATE_LIMIT_REDIS_RETRY']
+        self.redis_retry_at = 0
+        # Bounds in-flight requests per worker process
+        self.request_slots = threading.BoundedSemaphore(config['MAX_CONCURRENT_REQUESTS'])
+    
+    def consume(self, key, capacity, rate):
+        """Take a token from the shared backend, or from memory while it is unavailable"""
+        if self.backend is not self.memory_backend and time.monotonic() >= self.redis_retry_at:
+            try:
+                return self.backend.consume(key, capacity, rate)
+            except Exception as e:
+                # Keep limiting per process rather than paying a timeout on every request
+                self.redis_retry_at = time.monotonic() + self.redis_retry_interval
+                current_app.logger.warning(
+                    'Rate limit backend unavailable (%s), using in-memory buckets for %ss',
+                    e, self.redis_retry_interval
+                )
+        return self.memory_backend.consume(key, capacity, rate)
+
+
+def view_name():
+    """Name of the view handling the request, without the blueprint prefix"""
+    return (request.endpoint or '').rpartition('.')[2]
+
+
+def rate_limit_key():
+    """Identify the client by user id when authenticated, otherwise by IP"""
+    try:
+        verify_jwt_in_request(optional=True)
+        user_id = get_jwt_identity()
+    except Exception:
+        user_id = None
+    if user_id is not None:
+        return f'user:{user_id}'
+    return f'ip:{request.remote_addr}'
+
+
+@api.before_app_request
+def check_rate_limit():
+    """Reject clients that exceed the limit configured for this endpoint"""
+    admission = current_app.extensions['admission_control']
+    limit = admission.rate_limits.get(view_name())
+    if not current_app.config['RATE_LIMIT_ENABLED'] or not limit or request.method == 'OPTIONS':
+        return None
+    
+    key = f'{view_name()}:{rate_limit_key()}'
+    allowed, retry_after = admission.consume(key, *limit)
+    
+    if not allowed:
+        response = jsonify({'error': 'Too many requests'})
+        response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+        return response, 429
+    return None
+
+
+def request_queue_time():
+    """Seconds since a trusted proxy received the request, from X-Request-Start"""
+    header = request.headers.get('X-Request-Start')
+    if not header or not current_app.config['TRUSTED_PROXIES']:
+        return None
+    try:
+        started = float(header.removeprefix('t='))
+    except ValueError:
+        return None
+    # nginx sends seconds ($msec); other proxies send milliseconds or microseconds
+    while started > 1e11:
+        started /= 1000
+    return max(0.0, time.time() - started)
+
+
+def overloaded_response():
+    """503 telling the client when to retry"""
+    response = jsonify({'error': 'Server is busy, please retry later'})
+    response.headers['Retry-After'] = str(current_app.config['OVERLOAD_RETRY_AFTER'])
+    return response, 503
+
+
+@api.before_app_request
+def acquire_request_slot():
+    """Shed load with 503 once a request has queued longer than the budget"""
+    if view_name() == 'health_check':
+        return None
+    
+    # Time spent in the proxy and the server's accept backlog, which is where
+    # requests wait with single-threaded workers
+    budget = current_app.config['REQUEST_QUEUE_TIMEOUT']
+    queue_time = request_queue_time() or 0.0
+    if queue_time > budget:
+        return overloaded_response()
+    
+    # Time spent waiting for a slot among this process's threads
+    request_slots = current_app.extensions['admission_control'].request_slots
+    if not request_slots.acquire(timeout=budget - queue_time):
+        return overloaded_response()
+    g.holds_request_slot = True
+    return None
+
+
+@api.teardown_app_request
+def release_request_slot(exc):
+    """Free the slot taken by acquire_request_slot"""
+    if g.pop('holds_request_slot', False):
+        current_app.extensions['admission_control'].request_slots.release()
+
+
 # ==================== Authentication Endpoints ====================
 
-@app.route('/api/auth/register', methods=['POST'])
+@jwt.token_in_blocklist_loader
+def reject_deleted_account(jwt_header, jwt_payload):
+    """Treat tokens of accounts waiting to be purged as revoked"""
+    return pending_job(purge_job_key(jwt_payload['sub'])) is not None
+
+
+@api.route('/api/auth/register', methods=['POST'])
 def register():
     """Register a new user"""
     data = request.get_json()
@@ -197,7 +495,7 @@ def register():
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/auth/login', methods=['POST'])
+@api.route('/api/auth/login', methods=['POST'])
 def login():
     """Login user"""
     data = request.get_json()
@@ -210,6 +508,9 @@ def login():
     if not user or not user.check_password(data['password']):
         return jsonify({'error': 'Invalid username or password'}), 401
     
+    if pending_job(purge_job_key(user.id)):
+        return jsonify({'error': 'Account is being deleted'}), 403
+    
     access_token = create_access_token(identity=user.id)
     
     return jsonify({
@@ -219,7 +520,7 @@ def login():
     }), 200
 
 
-@app.route('/api/auth/me', methods=['GET'])
+@api.route('/api/auth/me', methods=['GET'])
 @jwt_required()
 def get_current_user():
     """Get current authenticated user"""
@@ -232,7 +533,7 @@ def get_current_user():
     return jsonify(user.to_dict(include_email=True)), 200
 
 
-@app.route('/api/auth/refresh', methods=['POST'])
+@api.route('/api/auth/refresh', methods=['POST'])
 @jwt_required()
 def refresh_token():
     """Refresh access token"""
@@ -248,7 +549,7 @@ def refresh_token():
 
 # ==================== User Endpoints ====================
 
-@app.route('/api/users/<int:user_id>', methods=['GET'])
+@api.route('/api/users/<int:user_id>', methods=['GET'])
 def get_user(user_id):
     """Get user profile by ID"""
     user = User.query.get(user_id)
@@ -259,7 +560,7 @@ def get_user(user_id):
     return jsonify(user.to_dict()), 200
 
 
-@app.route('/api/users/<int:user_id>', methods=['PUT'])
+@api.route('/api/users/<int:user_id>', methods=['PUT'])
 @jwt_required()
 def update_user(user_id):
     """Update user profile"""
@@ -292,7 +593,7 @@ def update_user(user_id):
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/users/<int:user_id>/wishes', methods=['GET'])
+@api.route('/api/users/<int:user_id>/wishes', methods=['GET'])
 def get_user_wishes(user_id):
     """Get all wishes by a user"""
     user = User.query.get(user_id)
@@ -308,9 +609,34 @@ def get_user_wishes(user_id):
     }), 200
 
 
+@api.route('/api/users/<int:user_id>', methods=['DELETE'])
+@jwt_required()
+def delete_user(user_id):
+    """Delete a user account and all of its content"""
+    current_user_id = get_jwt_identity()
+    
+    if current_user_id != user_id:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    if not User.query.get(user_id):
+        return jsonify({'error': 'User not found'}), 404
+    
+    # Large accounts can own a lot of rows, so the worker purges them in batches
+    if pending_job(purge_job_key(user_id)):
+        return jsonify({'message': 'User deletion scheduled'}), 202
+    
+    try:
+        enqueue('purge_user', key=purge_job_key(user_id), user_id=user_id)
+        db.session.commit()
+        return jsonify({'message': 'User deletion scheduled'}), 202
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
 # ==================== Wish Endpoints ====================
 
-@app.route('/api/wishes', methods=['GET'])
+@api.route('/api/wishes', methods=['GET'])
 def get_wishes():
     """Get all public wishes with pagination and filtering"""
     page = request.args.get('page', 1, type=int)
@@ -343,7 +669,32 @@ def get_wishes():
     }), 200
 
 
-@app.route('/api/wishes', methods=['POST'])
+@api.route('/api/wishes/facets', methods=['GET'])
+def get_wish_facets():
+    """Get public wish counts by category and status, optionally scoped to a search"""
+    query = request.args.get('q', '').strip()
+    
+    if query and len(query) < 2:
+        return jsonify({'error': 'Query must be at least 2 characters'}), 400
+    
+    facets = {'category': {}, 'status': {}}
+    if query:
+        matches = Wish.query.filter(Wish.is_public == True, search_filter(query))
+        for facet, column in (('category', Wish.category), ('status', Wish.status)):
+            rows = matches.with_entities(column, db.func.count(Wish.id)).filter(column.isnot(None)).group_by(column)
+            facets[facet] = {value: count for value, count in rows}
+    else:
+        for row in WishFacetCount.query.filter(WishFacetCount.count > 0):
+            facets[row.facet][row.value] = row.count
+    
+    return jsonify({
+        'query': query or None,
+        'categories': facets['category'],
+        'statuses': facets['status']
+    }), 200
+
+
+@api.route('/api/wishes', methods=['POST'])
 @jwt_required()
 def create_wish():
     """Create a new wish"""
@@ -366,6 +717,8 @@ def create_wish():
         )
         
         db.session.add(wish)
+        db.session.flush()  # apply column defaults before counting the wish
+        apply_facet_deltas(facet_deltas(*facet_state(wish)))
         db.session.commit()
         
         return jsonify({
@@ -377,7 +730,7 @@ def create_wish():
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/wishes/<int:wish_id>', methods=['GET'])
+@api.route('/api/wishes/<int:wish_id>', methods=['GET'])
 def get_wish(wish_id):
     """Get a single wish by ID"""
     wish = Wish.query.get(wish_id)
@@ -388,7 +741,7 @@ def get_wish(wish_id):
     return jsonify(wish.to_dict(include_comments=True)), 200
 
 
-@app.route('/api/wishes/<int:wish_id>', methods=['PUT'])
+@api.route('/api/wishes/<int:wish_id>', methods=['PUT'])
 @jwt_required()
 def update_wish(wish_id):
     """Update a wish"""
@@ -402,6 +755,7 @@ def update_wish(wish_id):
         return jsonify({'error': 'Unauthorized'}), 403
     
     data = request.get_json()
+    old_facet_state = facet_state(wish)
     
     if 'title' in data:
         wish.title = data['title']
@@ -421,6 +775,9 @@ def update_wish(wish_id):
         wish.target_date = datetime.fromisoformat(data['target_date']) if data['target_date'] else None
     
     try:
+        deltas = facet_deltas(*old_facet_state, -1)
+        deltas.update(facet_deltas(*facet_state(wish)))
+        apply_facet_deltas(deltas)
         db.session.commit()
         return jsonify({
             'message': 'Wish updated successfully',
@@ -431,7 +788,7 @@ def update_wish(wish_id):
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/wishes/<int:wish_id>', methods=['DELETE'])
+@api.route('/api/wishes/<int:wish_id>', methods=['DELETE'])
 @jwt_required()
 def delete_wish(wish_id):
     """Delete a wish"""
@@ -445,6 +802,11 @@ def delete_wish(wish_id):
         return jsonify({'error': 'Unauthorized'}), 403
     
     try:
+        apply_facet_deltas(facet_deltas(*facet_state(wish), -1))
+        # Bulk deletes instead of relying on ON DELETE CASCADE, which databases
+        # created before the cascade was added do not have yet
+        Like.query.filter_by(wish_id=wish_id).delete(synchronize_session=False)
+        Comment.query.filter_by(wish_id=wish_id).delete(synchronize_session=False)
         db.session.delete(wish)
         db.session.commit()
         return jsonify({'message': 'Wish deleted successfully'}), 200
@@ -455,7 +817,7 @@ def delete_wish(wish_id):
 
 # ==================== Comment Endpoints ====================
 
-@app.route('/api/wishes/<int:wish_id>/comments', methods=['GET'])
+@api.route('/api/wishes/<int:wish_id>/comments', methods=['GET'])
 def get_comments(wish_id):
     """Get all comments for a wish"""
     wish = Wish.query.get(wish_id)
@@ -471,7 +833,7 @@ def get_comments(wish_id):
     }), 200
 
 
-@app.route('/api/wishes/<int:wish_id>/comments', methods=['POST'])
+@api.route('/api/wishes/<int:wish_id>/comments', methods=['POST'])
 @jwt_required()
 def create_comment(wish_id):
     """Add a comment to a wish"""
@@ -505,7 +867,7 @@ def create_comment(wish_id):
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/comments/<int:comment_id>', methods=['PUT'])
+@api.route('/api/comments/<int:comment_id>', methods=['PUT'])
 @jwt_required()
 def update_comment(comment_id):
     """Update a comment"""
@@ -536,7 +898,7 @@ def update_comment(comment_id):
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/comments/<int:comment_id>', methods=['DELETE'])
+@api.route('/api/comments/<int:comment_id>', methods=['DELETE'])
 @jwt_required()
 def delete_comment(comment_id):
     """Delete a comment"""
@@ -560,7 +922,7 @@ def delete_comment(comment_id):
 
 # ==================== Like Endpoints ====================
 
-@app.route('/api/wishes/<int:wish_id>/like', methods=['POST'])
+@api.route('/api/wishes/<int:wish_id>/like', methods=['POST'])
 @jwt_required()
 def like_wish(wish_id):
     """Like a wish"""
@@ -589,7 +951,7 @@ def like_wish(wish_id):
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/wishes/<int:wish_id>/unlike', methods=['POST'])
+@api.route('/api/wishes/<int:wish_id>/unlike', methods=['POST'])
 @jwt_required()
 def unlike_wish(wish_id):
     """Unlike a wish"""
@@ -610,7 +972,7 @@ def unlike_wish(wish_id):
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/wishes/<int:wish_id>/likes', methods=['GET'])
+@api.route('/api/wishes/<int:wish_id>/likes', methods=['GET'])
 def get_wish_likes(wish_id):
     """Get all likes for a wish"""
     wish = Wish.query.get(wish_id)
@@ -629,7 +991,7 @@ def get_wish_likes(wish_id):
 
 # ==================== Stats & Search Endpoints ====================
 
-@app.route('/api/stats', methods=['GET'])
+@api.route('/api/stats', methods=['GET'])
 def get_stats():
     """Get general statistics"""
     total_users = User.query.count()
@@ -645,7 +1007,7 @@ def get_stats():
     }), 200
 
 
-@app.route('/api/search', methods=['GET'])
+@api.route('/api/search', methods=['GET'])
 def search():
     """Search wishes by title or content"""
     query = request.args.get('q', '').strip()
@@ -657,7 +1019,7 @@ def search():
     
     wishes = Wish.query.filter(
         Wish.is_public == True,
-        (Wish.title.ilike(f'%{query}%') | Wish.content.ilike(f'%{query}%'))
+        search_filter(query)
     ).order_by(Wish.created_at.desc()).paginate(page=page, per_page=per_page)
     
     return jsonify({
@@ -669,15 +1031,275 @@ def search():
     }), 200
 
 
+def search_filter(query):
+    """Match wishes whose title or content contains the query"""
+    return Wish.title.ilike(f'%{query}%') | Wish.content.ilike(f'%{query}%')
+
+
+# ==================== Background Jobs ====================
+
+# Registered task functions and periodic schedules, filled by @task
+TASKS = {}
+PERIODIC_TASKS = {}
+
+worker_logger = logging.getLogger('wish_wall.worker')
+
+
+def task(name, every=None):
+    """Register a function as a background task; `every` names the config key
+    holding its interval in seconds when it should also run periodically"""
+    def decorator(f):
+        TASKS[name] = f
+        if every:
+            PERIODIC_TASKS[name] = every
+        return f
+    return decorator
+
+
+def enqueue(name, delay=0, key=None, **payload):
+    """Add a job to the current session; it is queued when the caller commits"""
+    if name not in TASKS:
+        raise ValueError(f'Unknown task: {name}')
+    job = Job(
+        name=name,
+        key=key,
+        payload=payload,
+        max_attempts=current_app.config['JOB_MAX_ATTEMPTS'],
+        run_at=datetime.utcnow() + timedelta(seconds=delay)
+    )
+    db.session.add(job)
+    return job
+
+
+def pending_job(key):
+    """The queued or running job enqueued with this key, if any"""
+    return Job.query.filter(Job.key == key, Job.status.in_(['queued', 'running'])).first()
+
+
+def claim_next_job():
+    """Atomically mark the next due job as running, or return None"""
+    while True:
+        now = datetime.utcnow()
+        job = Job.query.filter(Job.status == 'queued', Job.run_at <= now).order_by(Job.run_at).first()
+        if not job:
+            return None
+        
+        # The status check makes the claim safe when several workers race for a job
+        claimed = Job.query.filter_by(id=job.id, status='queued').update(
+            {'status': 'running', 'locked_at': now, 'attempts': Job.attempts + 1},
+            synchronize_session=False
+        )
+        db.session.commit()
+        if claimed:
+            db.session.refresh(job)
+            return job
+
+
+def run_job(job):
+    """Execute a claimed job, scheduling a retry with exponential backoff on failure"""
+    g.current_job_id = job.id
+    try:
+        TASKS[job.name](**(job.payload or {}))
+        job.status = 'done'
+        job.last_error = None
+    except Exception as e:
+        db.session.rollback()
+        worker_logger.exception('Job %s (%s) failed', job.id, job.name)
+        job.last_error = repr(e)
+        if job.attempts >= job.max_attempts:
+            job.status = 'failed'
+        else:
+            job.status = 'queued'
+            job.run_at = datetime.utcnow() + timedelta(seconds=current_app.config['JOB_RETRY_BASE_DELAY'] * 2 ** (job.attempts - 1))
+    finally:
+        g.pop('current_job_id', None)
+    job.locked_at = None
+    db.session.commit()
+
+
+def job_heartbeat():
+    """Refresh the lock of the running job so cleanup_jobs does not take it over;
+    long tasks call this between units of work, it joins the caller's transaction"""
+    job_id = g.get('current_job_id')
+    if job_id:
+        Job.query.filter_by(id=job_id).update({'locked_at': datetime.utcnow()}, synchronize_session=False)
+
+
+def run_pending_jobs(limit=None):
+    """Run due jobs until the queue is empty or `limit` jobs were processed"""
+    processed = 0
+    while limit is None or processed < limit:
+        job = claim_next_job()
+        if not job:
+            break
+        run_job(job)
+        processed += 1
+    return processed
+
+
+def schedule_periodic_tasks(next_runs):
+    """Enqueue periodic tasks that are due and not already pending"""
+    now = time.monotonic()
+    for name, interval_key in PERIODIC_TASKS.items():
+        every = current_app.config[interval_key]
+        if not every or next_runs.get(name, 0) > now:
+            continue
+        pending = Job.query.filter(Job.name == name, Job.status.in_(['queued', 'running'])).first()
+        if not pending:
+            enqueue(name)
+        next_runs[name] = now + every
+    db.session.commit()
+
+
+@task('cleanup_jobs', every='JOB_CLEANUP_INTERVAL')
+def cleanup_jobs():
+    """Recover jobs abandoned by a crashed worker and drop old finished ones"""
+    now = datetime.utcnow()
+    abandoned = Job.query.filter(
+        Job.status == 'running',
+        Job.locked_at < now - timedelta(seconds=current_app.config['JOB_LOCK_TIMEOUT'])
+    )
+    # A job that keeps killing its worker must not be retried forever
+    abandoned.filter(Job.attempts >= Job.max_attempts).update(
+        {'status': 'failed', 'locked_at': None, 'last_error': 'Worker stopped while running the job'},
+        synchronize_session=False
+    )
+    abandoned.update({'status': 'queued', 'locked_at': None}, synchronize_session=False)
+    Job.query.filter(
+        Job.status.in_(['done', 'failed']),
+        Job.updated_at < now - timedelta(days=current_app.config['JOB_RETENTION_DAYS'])
+    ).delete(synchronize_session=False)
+    db.session.commit()
+
+
+# ==================== Facet Counts ====================
+
+def facet_state(wish):
+    """The wish fields that decide which facet counts it contributes to"""
+    return wish.is_public, wish.category, wish.status
+
+
+def facet_deltas(is_public, category, status, delta=1):
+    """Count changes for adding (delta=1) or removing (delta=-1) one wish"""
+    if not is_public:
+        return Counter()
+    return Counter({key: delta for key in (('category', category), ('status', status)) if key[1] is not None})
+
+
+# Dialects with INSERT ... ON CONFLICT, the databases this app runs on
+UPSERT_INSERTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+
+def upsert_facet_count(facet, value, count, increment=True):
+    """Add `count` to a facet row (or set it, with increment=False) in one statement,
+    so concurrent writers creating the same row do not collide"""
+    insert = UPSERT_INSERTS[db.session.get_bind().dialect.name]
+    stmt = insert(WishFacetCount).values(facet=facet, value=value, count=count)
+    new_count = WishFacetCount.count + stmt.excluded.count if increment else stmt.excluded.count
+    db.session.execute(stmt.on_conflict_do_update(index_elements=['facet', 'value'], set_={'count': new_count}))
+
+
+def apply_facet_deltas(deltas):
+    """Add deltas to the aggregate rows in the current transaction"""
+    # Always lock rows in (facet, value) order so concurrent writers cannot deadlock
+    for (facet, value), delta in sorted(deltas.items()):
+        if delta:
+            upsert_facet_count(facet, value, delta)
+
+
+def decrement_wish_facets(wish_ids):
+    """Remove a batch of wishes from the facet counts before they are deleted"""
+    deltas = Counter()
+    rows = db.session.query(Wish.category, Wish.status, db.func.count(Wish.id)).filter(
+        Wish.id.in_(wish_ids),
+        Wish.is_public == True
+    ).group_by(Wish.category, Wish.status)
+    for category, status, count in rows:
+        deltas.update(facet_deltas(True, category, status, -count))
+    apply_facet_deltas(deltas)
+
+
+@task('rebuild_facet_counts', every='FACET_REBUILD_INTERVAL')
+def rebuild_facet_counts():
+    """Recompute the facet counts from scratch to correct any drift; writes
+    committed between the count and the update are corrected by the next run"""
+    # Count before taking any counter locks, so the table scans do not block wish writes
+    counts = {}
+    for facet, column in (('category', Wish.category), ('status', Wish.status)):
+        rows = db.session.query(column, db.func.count(Wish.id)).filter(
+            Wish.is_public == True,
+            column.isnot(None)
+        ).group_by(column)
+        counts.update(((facet, value), count) for value, count in rows)
+    db.session.commit()
+    
+    # Create missing rows in their own transaction, so the locking step below
+    # only touches rows that already exist
+    existing = set(db.session.query(WishFacetCount.facet, WishFacetCount.value))
+    for facet, value in sorted(counts.keys() - existing):
+        upsert_facet_count(facet, value, 0)
+    db.session.commit()
+    
+    # Lock in the same order as apply_facet_deltas and only rewrite rows that drifted;
+    # rows are never deleted, so concurrent writers always find the row they upsert into
+    rows = WishFacetCount.query.order_by(WishFacetCount.facet, WishFacetCount.value).with_for_update()
+    for row in rows:
+        count = counts.get((row.facet, row.value), 0)
+        if row.count != count:
+            row.count = count
+    db.session.commit()
+
+
+# ==================== User Purge ====================
+
+def delete_in_batches(model, criterion, batch_size, before_delete=None):
+    """Delete rows matching criterion in short transactions of at most batch_size rows"""
+    deleted = 0
+    while True:
+        # Row locks keep a concurrent purge from processing the same batch twice
+        batch = db.session.query(model.id).filter(criterion).limit(batch_size).with_for_update(skip_locked=True)
+        ids = [row.id for row in batch]
+        if not ids:
+            return deleted
+        if before_delete:
+            before_delete(ids)
+        model.query.filter(model.id.in_(ids)).delete(synchronize_session=False)
+        job_heartbeat()
+        db.session.commit()
+        deleted += len(ids)
+
+
+def purge_job_key(user_id):
+    """Job key of the purge for a user"""
+    return f'purge_user:{user_id}'
+
+
+@task('purge_user')
+def purge_user(user_id, batch_size=None):
+    """Remove a user in batches so no single statement holds locks for long"""
+    batch_size = batch_size or current_app.config['USER_PURGE_BATCH_SIZE']
+    user_wish_ids = db.select(Wish.id).where(Wish.user_id == user_id)
+    
+    # Clear children of the user's wishes first, otherwise deleting a popular
+    # wish would cascade over all of its likes and comments in one statement
+    deleted = delete_in_batches(Like, db.or_(Like.user_id == user_id, Like.wish_id.in_(user_wish_ids)), batch_size)
+    deleted += delete_in_batches(Comment, db.or_(Comment.user_id == user_id, Comment.wish_id.in_(user_wish_ids)), batch_size)
+    deleted += delete_in_batches(Wish, Wish.user_id == user_id, batch_size, before_delete=decrement_wish_facets)
+    
+    User.query.filter_by(id=user_id).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+
 # ==================== Error Handlers ====================
 
-@app.errorhandler(404)
+@api.app_errorhandler(404)
 def not_found(error):
     """Handle 404 errors"""
     return jsonify({'error': 'Not found'}), 404
 
 
-@app.errorhandler(500)
+@api.app_errorhandler(500)
 def internal_error(error):
     """Handle 500 errors"""
     db.session.rollback()
@@ -686,7 +1308,7 @@ def internal_error(error):
 
 # ==================== Health Check ====================
 
-@app.route('/api/health', methods=['GET'])
+@api.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     return jsonify({'status': 'healthy'}), 200
@@ -694,14 +1316,14 @@ def health_check():
 
 # ==================== Database Initialization ====================
 
-@app.cli.command()
+@api.cli.command()
 def init_db():
     """Initialize the database"""
     db.create_all()
     print('Database initialized successfully')
 
 
-@app.cli.command()
+@api.cli.command()
 def seed_db():
     """Seed the database with sample data"""
     # Check if data already exists
@@ -750,11 +1372,92 @@ def seed_db():
     
     db.session.add_all([wish1, wish2])
     db.session.commit()
+    rebuild_facet_counts()
     
     print('Database seeded successfully')
 
 
+@api.cli.command('purge-user')
+@click.argument('user_id', type=int)
+@click.option('--batch-size', type=int, default=None, help='Rows deleted per transaction')
+def purge_user_command(user_id, batch_size):
+    """Delete a user and all of their content in batches"""
+    if not User.query.get(user_id):
+        print(f'User {user_id} not found')
+        return
+    
+    deleted = purge_user(user_id, batch_size)
+    print(f'User {user_id} purged ({deleted} related rows deleted)')
+
+
+@api.cli.command('run-worker')
+@click.option('--once', is_flag=True, help='Run due jobs and exit instead of polling')
+@click.option('--poll-interval', type=float, default=None, help='Seconds to sleep when the queue is empty')
+def run_worker_command(once, poll_interval):
+    """Process background jobs and schedule periodic tasks"""
+    logging.basicConfig(level=logging.INFO)
+    poll_interval = poll_interval or current_app.config['WORKER_POLL_INTERVAL']
+    next_runs = {}
+    
+    print('Worker started')
+    while True:
+        try:
+            schedule_periodic_tasks(next_runs)
+            processed = run_pending_jobs()
+        except Exception:
+            if once:
+                raise
+            # e.g. the database restarting; keep polling instead of exiting
+            db.session.rollback()
+            worker_logger.exception('Worker iteration failed, retrying in %ss', poll_interval)
+            time.sleep(poll_interval)
+            continue
+        if once:
+            print(f'Processed {processed} jobs')
+            return
+        if not processed:
+            time.sleep(poll_interval)
+
+
+# ==================== Application Factory ====================
+
+def create_app(config=None):
+    """Create an app with its own config and extension state"""
+    started = time.perf_counter()
+    timings = {}
+    
+    app = Flask(__name__)
+    app.config.update(load_config())
+    if config:
+        app.config.update(config)
+    # Flask's logger only shows warnings outside debug mode
+    app.logger.setLevel(app.config['LOG_LEVEL'])
+    timings['config'] = time.perf_counter() - started
+    
+    # Database connections and the Redis client are only opened on first use,
+    # so an app created before forking (gunicorn --preload) shares no sockets
+    db.init_app(app)
+    jwt.init_app(app)
+    cors.init_app(app)
+    app.extensions['admission_control'] = AdmissionControl(app.config)
+    timings['extensions'] = time.perf_counter() - started - timings['config']
+    
+    app.register_blueprint(api)
+    
+    # Behind nginx every request comes from the proxy's address; take the client
+    # address from X-Forwarded-For so rate limits apply per client
+    if app.config['TRUSTED_PROXIES']:
+        proxies = app.config['TRUSTED_PROXIES']
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies, x_proto=proxies)
+    timings['total'] = time.perf_counter() - started
+    
+    app.extensions['startup_timings'] = timings
+    app.logger.info('App created in %.1f ms', timings['total'] * 1000)
+    return app
+
+
 if __name__ == '__main__':
+    app = create_app()
     with app.app_context():
         db.create_all()
     app.run(debug=True, host='0.0.0.0', port=5000)
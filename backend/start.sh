@@ -29,12 +29,10 @@ echo "Installing dependencies..."
 pip install --upgrade pip
 pip install -r requirements.txt
 
-# Run database migrations (if using)
+# Create any missing tables
 echo "Running database setup..."
-if [ -f "migrate.py" ]; then
-    python migrate.py
-fi
+flask --app app init-db
 
-# Start the application
+# Start the application; --preload builds the app once before forking workers
 echo "Starting application server..."
-python -m uvicorn main:app --host 0.0.0.0 --port 8000 --reload
+exec gunicorn --preload --workers "${WEB_CONCURRENCY:-4}" --bind 0.0.0.0:8000 'app:create_app()'
@@ -0,0 +1,47 @@
+import pytest
+from flask_jwt_extended import create_access_token
+
+from app import create_app, db, User
+
+
+@pytest.fixture
+def make_app():
+    """Build an isolated app on an in-memory database; keyword args override config"""
+    def factory(**config):
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+            'REDIS_URL': None,
+            'TRUSTED_PROXIES': 0,
+            'RATE_LIMITS': '',
+            **config
+        })
+        with app.app_context():
+            db.create_all()
+        return app
+    return factory
+
+
+@pytest.fixture
+def app(make_app):
+    app = make_app()
+    with app.app_context():
+        yield app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def user(app):
+    user = User(username='john_doe', email='john@example.com')
+    user.set_password('password123')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+@pytest.fixture
+def auth_headers(app, user):
+    return {'Authorization': f'Bearer {create_access_token(identity=user.id)}'}
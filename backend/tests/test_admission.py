@@ -0,0 +1,148 @@
+import time
+
+import pytest
+
+from flask_jwt_extended import create_access_token
+
+from app import MemoryRateLimitBackend, User, db, parse_rate_limits
+
+
+def test_parse_rate_limits():
+    limits = parse_rate_limits('login=10/minute, search=2/second')
+    assert limits == {'login': (10, 10 / 60), 'search': (2, 2.0)}
+
+
+def test_memory_backend_refills_over_time(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: now[0])
+    backend = MemoryRateLimitBackend()
+    
+    assert backend.consume('k', 2, 1.0) == (True, 0)
+    assert backend.consume('k', 2, 1.0) == (True, 0)
+    allowed, retry_after = backend.consume('k', 2, 1.0)
+    assert not allowed
+    assert retry_after == pytest.approx(1.0)
+    
+    now[0] += 1.0
+    assert backend.consume('k', 2, 1.0)[0]
+
+
+def test_memory_backend_prunes_buckets(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: now[0])
+    backend = MemoryRateLimitBackend(max_buckets=10)
+    
+    for i in range(10):
+        backend.consume(f'old{i}', 1, 1.0)
+    now[0] += 5  # the old buckets have refilled
+    backend.consume('active', 1, 1.0)
+    assert list(backend.buckets) == ['active']
+    
+    for i in range(20):
+        backend.consume(f'new{i}', 1, 1.0)
+    assert len(backend.buckets) <= 10
+    # The most recent client is kept and still limited
+    assert 'new19' in backend.buckets
+    assert not backend.consume('new19', 1, 1.0)[0]
+
+
+def test_rate_limit_returns_429_with_retry_after(make_app):
+    client = make_app(RATE_LIMITS='get_stats=2/minute').test_client()
+    
+    assert [client.get('/api/stats').status_code for _ in range(2)] == [200, 200]
+    response = client.get('/api/stats')
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+    # Endpoints without a configured limit are unaffected
+    assert client.get('/api/health').status_code == 200
+
+
+def test_rate_limit_keys_by_forwarded_ip_behind_trusted_proxy(make_app):
+    client = make_app(RATE_LIMITS='get_stats=1/minute', TRUSTED_PROXIES=1).test_client()
+    
+    assert client.get('/api/stats', headers={'X-Forwarded-For': '10.0.0.1'}).status_code == 200
+    assert client.get('/api/stats', headers={'X-Forwarded-For': '10.0.0.2'}).status_code == 200
+    assert client.get('/api/stats', headers={'X-Forwarded-For': '10.0.0.1'}).status_code == 429
+
+
+def test_forwarded_ip_ignored_without_trusted_proxy(make_app):
+    client = make_app(RATE_LIMITS='get_stats=1/minute').test_client()
+    
+    assert client.get('/api/stats', headers={'X-Forwarded-For': '10.0.0.1'}).status_code == 200
+    assert client.get('/api/stats', headers={'X-Forwarded-For': '10.0.0.2'}).status_code == 429
+
+
+def test_rate_limit_keys_by_user(make_app):
+    app = make_app(RATE_LIMITS='get_current_user=1/minute')
+    client = app.test_client()
+    with app.app_context():
+        user = User(username='jane', email='jane@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+        auth_headers = {'Authorization': f'Bearer {create_access_token(identity=user.id)}'}
+    
+    assert client.get('/api/auth/me', headers=auth_headers).status_code == 200
+    assert client.get('/api/auth/me', headers=auth_headers).status_code == 429
+    # Anonymous requests from the same address use a different bucket
+    assert client.get('/api/auth/me').status_code == 401
+
+
+class FailingBackend:
+    calls = 0
+    
+    def consume(self, key, capacity, rate):
+        self.calls += 1
+        raise ConnectionError('redis down')
+
+
+def test_circuit_breaker_falls_back_to_memory(make_app):
+    app = make_app(RATE_LIMITS='get_stats=1/minute', RATE_LIMIT_REDIS_RETRY=60)
+    backend = FailingBackend()
+    app.extensions['admission_control'].backend = backend
+    client = app.test_client()
+    
+    assert client.get('/api/stats').status_code == 200
+    assert client.get('/api/stats').status_code == 429
+    assert backend.calls == 1
+
+
+def test_sheds_requests_that_queued_too_long(make_app):
+    client = make_app(TRUSTED_PROXIES=1, REQUEST_QUEUE_TIMEOUT=0.5).test_client()
+    
+    response = client.get('/api/stats', headers={'X-Request-Start': f't={time.time() - 2:.3f}'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    # Microsecond timestamps are accepted too
+    fresh = str(int(time.time() * 1e6))
+    assert client.get('/api/stats', headers={'X-Request-Start': fresh}).status_code == 200
+    assert client.get('/api/health', headers={'X-Request-Start': 't=1'}).status_code == 200
+
+
+def test_queue_start_header_ignored_without_trusted_proxy(make_app):
+    client = make_app(REQUEST_QUEUE_TIMEOUT=0.5).test_client()
+    
+    response = client.get('/api/stats', headers={'X-Request-Start': f't={time.time() - 2:.3f}'})
+    assert response.status_code == 200
+
+
+def test_sheds_requests_when_no_slot_frees_up(make_app):
+    app = make_app(MAX_CONCURRENT_REQUESTS=1, REQUEST_QUEUE_TIMEOUT=0.05)
+    client = app.test_client()
+    request_slots = app.extensions['admission_control'].request_slots
+    
+    request_slots.acquire()
+    try:
+        assert client.get('/api/stats').status_code == 503
+    finally:
+        request_slots.release()
+    assert client.get('/api/stats').status_code == 200
+    assert client.get('/api/stats').status_code == 200
+
+
+def test_apps_do_not_share_admission_state(make_app):
+    limited = make_app(RATE_LIMITS='get_stats=1/minute').test_client()
+    other = make_app().test_client()
+    
+    limited.get('/api/stats')
+    assert limited.get('/api/stats').status_code == 429
+    assert other.get('/api/stats').status_code == 200
@@ -0,0 +1,93 @@
+from collections import Counter
+
+import app as wish_wall
+from app import Wish, WishFacetCount, apply_facet_deltas, db, purge_user, rebuild_facet_counts, upsert_facet_count
+
+
+def stored_counts():
+    return {(row.facet, row.value): row.count for row in WishFacetCount.query if row.count}
+
+
+def rebuilt_counts():
+    rebuild_facet_counts()
+    return stored_counts()
+
+
+def create_wish(client, headers, **fields):
+    response = client.post('/api/wishes', json={'title': 'Learn guitar', 'content': 'Play classics', **fields}, headers=headers)
+    assert response.status_code == 201
+    return response.json['wish']['id']
+
+
+def test_counts_follow_wish_writes(app, client, auth_headers):
+    travel = create_wish(client, auth_headers, category='travel')
+    create_wish(client, auth_headers, category='travel')
+    private = create_wish(client, auth_headers, category='hobby', is_public=False)
+    
+    assert stored_counts() == {('category', 'travel'): 2, ('status', 'active'): 2}
+    
+    client.put(f'/api/wishes/{travel}', json={'status': 'completed', 'category': 'career'}, headers=auth_headers)
+    client.put(f'/api/wishes/{private}', json={'is_public': True}, headers=auth_headers)
+    expected = {
+        ('category', 'travel'): 1, ('category', 'career'): 1, ('category', 'hobby'): 1,
+        ('status', 'active'): 2, ('status', 'completed'): 1,
+    }
+    assert stored_counts() == expected
+    
+    client.delete(f'/api/wishes/{private}', headers=auth_headers)
+    assert stored_counts() == rebuilt_counts()
+
+
+def test_facets_endpoint(app, client, auth_headers):
+    create_wish(client, auth_headers, category='travel', title='Visit Japan')
+    create_wish(client, auth_headers, category='hobby')
+    
+    data = client.get('/api/wishes/facets').json
+    assert data == {'query': None, 'categories': {'travel': 1, 'hobby': 1}, 'statuses': {'active': 2}}
+    
+    scoped = client.get('/api/wishes/facets?q=japan').json
+    assert scoped == {'query': 'japan', 'categories': {'travel': 1}, 'statuses': {'active': 1}}
+    assert client.get('/api/wishes/facets?q=j').status_code == 400
+
+
+def test_upsert_creates_and_increments(app):
+    upsert_facet_count('category', 'travel', 1)
+    upsert_facet_count('category', 'travel', 2)
+    db.session.commit()
+    assert stored_counts() == {('category', 'travel'): 3}
+    
+    upsert_facet_count('category', 'travel', 7, increment=False)
+    db.session.commit()
+    assert stored_counts() == {('category', 'travel'): 7}
+
+
+def test_deltas_applied_in_lock_order(app, monkeypatch):
+    applied = []
+    monkeypatch.setattr(wish_wall, 'upsert_facet_count', lambda facet, value, delta: applied.append((facet, value)))
+    
+    apply_facet_deltas(Counter({('status', 'active'): 1, ('category', 'travel'): -1, ('category', 'career'): 1}))
+    
+    assert applied == [('category', 'career'), ('category', 'travel'), ('status', 'active')]
+
+
+def test_rebuild_corrects_drift_in_place(app, user):
+    db.session.add(Wish(user_id=user.id, title='t', content='c', category='travel'))
+    upsert_facet_count('category', 'travel', 5)
+    upsert_facet_count('category', 'gone', 3)
+    db.session.commit()
+    
+    rebuild_facet_counts()
+    
+    rows = {(row.facet, row.value): row.count for row in WishFacetCount.query}
+    # Stale rows are zeroed rather than deleted
+    assert rows == {('category', 'travel'): 1, ('category', 'gone'): 0, ('status', 'active'): 1}
+
+
+def test_purge_removes_user_wishes_from_counts(app, client, user, auth_headers):
+    create_wish(client, auth_headers, category='travel')
+    create_wish(client, auth_headers, category='hobby')
+    
+    purge_user(user.id, batch_size=1)
+    
+    assert stored_counts() == {}
+    assert Wish.query.count() == 0
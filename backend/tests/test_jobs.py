@@ -0,0 +1,193 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import app as wish_wall
+from app import (
+    TASKS, Job, Wish, cleanup_jobs, claim_next_job, db, delete_in_batches, enqueue,
+    run_job, run_pending_jobs, schedule_periodic_tasks
+)
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    """Register a 'record' task that stores its calls and fails while told to"""
+    calls = {'args': [], 'failures': 0}
+    
+    def record(value):
+        calls['args'].append(value)
+        if calls['failures']:
+            calls['failures'] -= 1
+            raise RuntimeError('boom')
+    
+    monkeypatch.setitem(TASKS, 'record', record)
+    return calls
+
+
+def test_enqueue_rejects_unknown_task(app):
+    with pytest.raises(ValueError):
+        enqueue('does_not_exist')
+
+
+def test_job_runs_once_committed(app, calls):
+    enqueue('record', value=1)
+    db.session.commit()
+    
+    assert run_pending_jobs() == 1
+    assert calls['args'] == [1]
+    job = Job.query.one()
+    assert (job.status, job.attempts, job.locked_at) == ('done', 1, None)
+
+
+def test_delayed_job_waits(app, calls):
+    enqueue('record', delay=60, value=1)
+    db.session.commit()
+    
+    assert run_pending_jobs() == 0
+
+
+def test_claim_only_succeeds_once(app, calls):
+    enqueue('record', value=1)
+    db.session.commit()
+    
+    assert claim_next_job() is not None
+    assert claim_next_job() is None
+
+
+def test_failed_job_retries_with_backoff(app, calls):
+    app.config['JOB_RETRY_BASE_DELAY'] = 10
+    calls['failures'] = 2
+    enqueue('record', value=1)
+    db.session.commit()
+    
+    run_job(claim_next_job())
+    job = Job.query.one()
+    assert job.status == 'queued'
+    assert 'boom' in job.last_error
+    first_delay = job.run_at - datetime.utcnow()
+    assert timedelta(seconds=8) < first_delay <= timedelta(seconds=10)
+    
+    job.run_at = datetime.utcnow()
+    db.session.commit()
+    run_job(claim_next_job())
+    second_delay = Job.query.one().run_at - datetime.utcnow()
+    assert timedelta(seconds=18) < second_delay <= timedelta(seconds=20)
+
+
+def test_job_fails_after_max_attempts(app, calls):
+    app.config['JOB_RETRY_BASE_DELAY'] = 0
+    app.config['JOB_MAX_ATTEMPTS'] = 2
+    calls['failures'] = 5
+    enqueue('record', value=1)
+    db.session.commit()
+    
+    assert run_pending_jobs() == 2
+    job = Job.query.one()
+    assert (job.status, job.attempts) == ('failed', 2)
+
+
+def test_periodic_tasks_are_not_queued_twice(app):
+    schedule_periodic_tasks({})
+    schedule_periodic_tasks({})
+    
+    names = sorted(job.name for job in Job.query.all())
+    assert names == ['cleanup_jobs', 'rebuild_facet_counts']
+
+
+def test_periodic_task_disabled_by_zero_interval(app):
+    app.config['JOB_CLEANUP_INTERVAL'] = 0
+    schedule_periodic_tasks({})
+    
+    assert [job.name for job in Job.query.all()] == ['rebuild_facet_counts']
+
+
+def make_running_job(attempts, max_attempts, locked_for):
+    job = Job(
+        name='record',
+        status='running',
+        attempts=attempts,
+        max_attempts=max_attempts,
+        locked_at=datetime.utcnow() - timedelta(seconds=locked_for)
+    )
+    db.session.add(job)
+    db.session.commit()
+    return job.id
+
+
+def test_cleanup_recovers_abandoned_jobs(app):
+    app.config['JOB_LOCK_TIMEOUT'] = 600
+    retryable = make_running_job(attempts=1, max_attempts=3, locked_for=700)
+    exhausted = make_running_job(attempts=3, max_attempts=3, locked_for=700)
+    active = make_running_job(attempts=1, max_attempts=3, locked_for=10)
+    
+    cleanup_jobs()
+    
+    assert db.session.get(Job, retryable).status == 'queued'
+    assert db.session.get(Job, exhausted).status == 'failed'
+    assert db.session.get(Job, active).status == 'running'
+
+
+def test_batched_deletes_refresh_the_job_lock(app, user, monkeypatch):
+    db.session.add_all(Wish(user_id=user.id, title='t', content='c') for _ in range(3))
+    db.session.commit()
+    user_id = user.id
+    job_id = make_running_job(attempts=1, max_attempts=3, locked_for=700)
+    locks = []
+    
+    def purge():
+        delete_in_batches(Wish, Wish.user_id == user_id, batch_size=1)
+        locks.append(db.session.query(Job.locked_at).filter_by(id=job_id).scalar())
+    
+    monkeypatch.setitem(TASKS, 'record', purge)
+    run_job(db.session.get(Job, job_id))
+    
+    assert Wish.query.count() == 0
+    assert datetime.utcnow() - locks[0] < timedelta(seconds=5)
+
+
+def test_delete_user_enqueues_one_purge(app, client, user, auth_headers):
+    user_id = user.id
+    assert client.delete(f'/api/users/{user_id}', headers=auth_headers).status_code == 202
+    assert Job.query.filter_by(name='purge_user').count() == 1
+    
+    # The account is locked out until the worker purges it
+    assert client.delete(f'/api/users/{user_id}', headers=auth_headers).status_code == 401
+    login = client.post('/api/auth/login', json={'username': 'john_doe', 'password': 'password123'})
+    assert login.status_code == 403
+    assert Job.query.filter_by(name='purge_user').count() == 1
+    
+    run_pending_jobs()
+    assert client.get(f'/api/users/{user_id}').status_code == 404
+
+
+class StopWorker(BaseException):
+    pass
+
+
+def test_worker_survives_transient_errors(app, calls, monkeypatch):
+    enqueue('record', value=1)
+    db.session.commit()
+    failures = [RuntimeError('database restarting')]
+    schedule = wish_wall.schedule_periodic_tasks
+    
+    def flaky_schedule(next_runs):
+        if failures:
+            raise failures.pop()
+        schedule(next_runs)
+    
+    sleeps = []
+    
+    def sleep(seconds):
+        sleeps.append(seconds)
+        if len(sleeps) > 1:
+            raise StopWorker
+    
+    monkeypatch.setattr(wish_wall, 'schedule_periodic_tasks', flaky_schedule)
+    monkeypatch.setattr(time, 'sleep', sleep)
+    
+    with pytest.raises(StopWorker):
+        app.test_cli_runner().invoke(args=['run-worker', '--poll-interval', '0.5'], catch_exceptions=False)
+    
+    assert calls['args'] == [1]
+    assert sleeps == [0.5, 0.5]